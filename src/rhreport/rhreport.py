@@ -1,21 +1,95 @@
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import accumulate
 from pathlib import Path
 import numpy as np
-import matplotlib as mpl
-import matplotlib.pyplot as plt
+
+# Embed TrueType fonts and use maximum compression for PDF output (applied only while saving)
+_PDF_RCPARAMS = {'pdf.fonttype': 42, 'pdf.compression': 9}
+
+@lru_cache(maxsize=None)
+def _pyplot():
+    """ Import pyplot on first use, so importing this module does not load matplotlib
+    """
+    import matplotlib as mpl
+
+    # Reports are only rendered to file, use the non-interactive backend to avoid GUI
+    # initialisation, unless the host has already chosen or resolved a backend
+    if dict.__getitem__(mpl.rcParams, 'backend') is mpl.rcsetup._auto_backend_sentinel:
+        mpl.use('Agg')
+
+    import matplotlib.pyplot as plt
+    return plt
+
+def _escape_math(txt) -> str:
+    """ Escape dollar signs so text is never parsed as mathtext
+    """
+    return str(txt).replace('$', r'\$')
+
+def _decode_png(src):
+    """ Decode a PNG to uint8, dropping the alpha channel if the image is opaque
+    """
+    im = _pyplot().imread(src)
+
+    # PNGs are decoded as float [0-1], the PDF backend embeds 8-bit data anyway
+    if im.dtype != np.uint8:
+        im = (im*255).round().astype(np.uint8)
+
+    # Drop alpha channel if fully opaque
+    if im.ndim == 3 and im.shape[-1] == 4 and im[..., 3].min() == 255:
+        im = im[..., :3]
+
+    return im
+
+@lru_cache(maxsize=32)
+def _load_png(path: str, mtime: float):
+    """ Decode a PNG file, cached on resolved path and modification time
+    """
+    im = _decode_png(path)
+
+    # Prevent callers from modifying the cached image
+    im.setflags(write=False)
+    return im
+
+def _imread(src):
+    """ Read image from filename or file-like object, caching decoded files
+    """
+    if isinstance(src, (str, Path)):
+        path = Path(src).resolve()
+        return _load_png(str(path), path.stat().st_mtime)
+
+    # File-like objects cannot be cached reliably
+    return _decode_png(src)
 
 class RHReport:
     def __init__(self):
+        self._plt = _pyplot()
+
         # Set A4 paper (8.27 x 11.69 inches)
-        self.fig, self.ax = plt.subplots(figsize=(8.27,11.69), constrained_layout=True)
+        self.fig = self._plt.figure(figsize=(8.27,11.69))
+
+        # Create backdrop axes
+        self.reset()
+
+        # Set page margins [top, right, bottom, left]
+        self.margin = [0.075, 0.075, 0.05, 0.075]
+
+    def reset(self):
+        """ Clear the report, so the figure can be reused for the next report
+        """
+        self.fig.clear()
+
+        # Let the backdrop axes cover the full page, all elements are positioned manually
+        self.ax = self.fig.add_axes([0, 0, 1, 1])
+
+        # Inverse data transform, stable as the backdrop axes is never rescaled
+        self._data_inv = self.ax.transData.inverted()
 
         # Set facecolor
         self.ax.set_facecolor('white')
 
         # Remove axes from figure
         self.ax.axis('off')
-
-        # Set page margins [top, right, bottom, left]
-        self.margin = [0.075, 0.075, 0.05, 0.075]
         
     def set_title(self, ypos, title:str='', subtitle:str=None):
         """ Set the title
@@ -23,25 +97,32 @@ class RHReport:
 
         # Add title
         xpos = self.margin[3] 
-        titleax = self.ax.text(xpos, ypos, title, weight='bold', fontsize=24)
+        self.ax.text(xpos, ypos, _escape_math(title), weight='bold', fontsize=24)
 
         if subtitle is None:
             return
 
-        # Get width of title
-        r = self.fig.canvas.get_renderer()
-        bb = titleax.get_window_extent(renderer=r).transformed(self.ax.transData.inverted())
-        xpos += bb.width-0.005*len(title)
+        from matplotlib.font_manager import FontProperties
+        from matplotlib.textpath import text_to_path
+
+        # Get width of title (including a trailing space) from the font metrics in points
+        prop = FontProperties(weight='bold', size=24)
+        w, _, _ = text_to_path.get_text_width_height_descent(title + ' ', prop, ismath=False)
+
+        # Convert width from points to data coordinates
+        w = w * self.fig.dpi / 72
+        xpos += (self._data_inv.transform((w, 0)) - self._data_inv.transform((0, 0)))[0]
 
         # Add subtitle
-        self.ax.text(xpos, ypos, subtitle, fontsize=16)
+        self.ax.text(xpos, ypos, _escape_math(subtitle), fontsize=16)
     
-    def create_axes(self, pos: list, ncols:int=1):
+    def create_axes(self, pos: list, ncols:int=1, bare:bool=False):
         """ Add new axes to the figure
             
         Parameters:
             pos: [left, bottom, width, height]
             ncols: set the number of columns across
+            bare: create axes without ticks and frame (e.g. for images)
         """
 
         # Get position and dimensions
@@ -53,17 +134,38 @@ class RHReport:
         # Calculate width of axes
         colwidth = width/ncols
 
+        from matplotlib.axes import Axes
+
         # Allocate axes
         axs = []
 
         # Loop over each column
         for i in range(ncols):
-            axs.append(self.fig.add_axes([x+(i)*colwidth, y, colwidth, height]))
+            rect = [x+(i)*colwidth, y, colwidth, height]
+
+            if bare:
+                # Prepare axes without ticks and frame before adding it to the figure
+                ax = Axes(self.fig, rect)
+                ax.set_xticks([])
+                ax.set_yticks([])
+                ax.set_frame_on(False)
+                axs.append(self.fig.add_axes(ax))
+            else:
+                axs.append(self.fig.add_axes(rect))
         
         return axs
     
-    def add_text(self, xpos:float, ypos:float, txt:str, **kwargs):
-        self.ax.text(xpos, ypos, txt, kwargs)
+    def add_text(self, xpos:float, ypos:float, txt:str, fontsize:float=10, **kwargs):
+        """ Add text to the report
+
+        Parameters:
+            xpos: x-position [0-1]
+            ypos: y-position [0-1]
+            txt: text
+            fontsize: default 10
+            kwargs: passed on to matplotlib's Axes.text
+        """
+        return self.ax.text(xpos, ypos, txt, fontsize=fontsize, **kwargs)
 
     def set_demographics(self, pos:list, fields:dict={}):
         """ Create the demographics section
@@ -83,8 +185,7 @@ class RHReport:
         ymin = y - height
 
         # Create horizontal lines
-        self.ax.axhline(y=ymax, xmin=x, xmax=x+width, color='k', linewidth=1) # hline
-        self.ax.axhline(y=ymin, xmin=x, xmax=x+width, color='k', linewidth=1) #hline
+        self._draw_hlines([(x, x+width, ymax), (x, x+width, ymin)], color='k')
 
         # Get number of fields
         nfields = len(fields)
@@ -92,40 +193,29 @@ class RHReport:
         if not nfields:
             return
 
-        # Loop over all key/value pairs in 'fields' dict and calculate lenght of strings
-        strlen = []
-        for k,v in fields.items():
-            strlen.append(max([len(k),len(str(v))]))
-        
+        # Calculate length of strings for all key/value pairs in 'fields' dict
+        strlen = [max(len(k), len(str(v))) for k, v in fields.items()]
+
         # Calculate width of each field
-        colwidth = (width-0.02)/np.sum(np.array(strlen))
+        colwidth = (width-0.02)/(sum(strlen) or 1)
 
-        # Set starting x-position
+        # Calculate x-position of each field as offset from starting pos
         x0 = x+0.01
+        xpos = [x0 + offset*colwidth for offset in accumulate(strlen[:-1], initial=0)]
 
-        # Calculate the offset from starting pos
-        cumsum = np.cumsum(np.array(strlen))
-        
-        # Loop over each key/value pairs in 'fields' dict
-        i = 0
-        for k,v in fields.items():
-            # Handle first iteration differently
-            if i == 0:
-                xpos = x0
-            else:
-                xpos = x0+(cumsum[i-1]*colwidth)
-            
-            # Insert fields into the demograpchis section
-            if nfields> 1 and i == nfields-1:
+        # Insert fields into the demographics section
+        texts = []
+        for i, (k, v) in enumerate(fields.items()):
+            if nfields > 1 and i == nfields-1:
                 # Align last field to the right
-                self.ax.text(x+width-0.01, y-0.015, k, fontsize=7, ha='right')
-                self.ax.text(x+width-0.01, y-0.03, v, fontsize=9, ha='right')
+                texts.append((x+width-0.01, y-0.015, k, 7, 'normal', 'right'))
+                texts.append((x+width-0.01, y-0.03, v, 9, 'normal', 'right'))
             else:
                 # Align fields to the left
-                self.ax.text(xpos, y-0.015, k, fontsize=7, ha='left')
-                self.ax.text(xpos, y-0.03, v, fontsize=9, ha='left')
+                texts.append((xpos[i], y-0.015, k, 7, 'normal', 'left'))
+                texts.append((xpos[i], y-0.03, v, 9, 'normal', 'left'))
 
-            i+=1
+        self._draw_text_batch(texts)
 
     def create_table(self, pos: list, data: dict, rowheader: bool=True):
         """ Create table 
@@ -149,45 +239,90 @@ class RHReport:
         # Calculate column width - equal width (TODO: individual column widths)
         colwidth = width/ncols
 
+        # Determine number of rows in table
+        nrows = max(map(len, data.values()), default=0)
+
+        # Precompute x-positions of text and dividers for each column (incl. row header column)
+        col_text_xs = x + 0.015 + np.arange(ncols)*colwidth
+        col_div_xs_min = x + 0.01 + np.arange(ncols)*colwidth
+        col_div_xs_max = x + (np.arange(ncols)+1)*colwidth
+
+        # Precompute y-positions of text and dividers for each row
+        row_text_ys = y - 0.06 - np.arange(nrows)*0.025
+        row_div_ys = y - 0.069 - np.arange(nrows)*0.025
+
+        # Collect text entries (x, y, text, fontsize, weight, ha) and draw them in one batch
+        texts = []
+
+        # Collect horizontal line segments (xmin, xmax, y) and draw them in one batch
+        lines = []
+        dividers = []
+
         ### Header
         # Horizontal line
-        self.ax.axhline(y=y-0.01, xmin=x, xmax=x+width, color='k', linewidth=1) # hline
+        lines.append((x, x+width, y-0.01))
 
         # Iterate through each key
         for col, key in enumerate(data.keys()):
             # Add column header text
-            self.ax.text(x + 0.015 + (col+rowheader)*colwidth, y-0.03, key, weight='bold', fontsize=8, ha='left')
+            texts.append((col_text_xs[col+rowheader], y-0.03, key, 8, 'bold', 'left'))
         
         # Horizontal line
-        self.ax.axhline(y=y-0.04, xmin=x, xmax=x+width, color='k', linewidth=1) # hline
+        lines.append((x, x+width, y-0.04))
 
         ### Body
-        for col, (_, values) in enumerate(data.items()):
-            for row, (key, value) in enumerate(values.items()):
-                if col == 0 and rowheader:
-                    # Add title column in bold
-                    self.ax.text(x + 0.01, y-0.06-(row*0.025), key, fontsize=8, weight='bold')
-
-                    # Divider
-                    xmin = x
-                    xmax = x + colwidth
-                    self.ax.axhline(y=y-0.069-(row*0.025), xmin=xmin, xmax=xmax, color=(0.9,0.9,0.9), linewidth=1) # hline
-                
-                # Add column if rowheader is true
-                i = col+rowheader
+        # Flatten table into pre-stringified cells per column and the row header keys
+        cells = [[str(value) for value in values.values()] for values in data.values()]
+        row_keys = list(next(iter(data.values()), {}).keys())
+
+        if rowheader:
+            for row, key in enumerate(row_keys):
+                # Add title column in bold
+                texts.append((x + 0.01, row_text_ys[row], key, 8, 'bold', 'left'))
 
+                # Divider
+                dividers.append((x, col_div_xs_max[0], row_div_ys[row]))
+
+        for col, col_vals in enumerate(cells):
+            # Add column if rowheader is true
+            i = col+rowheader
+
+            for row, value in enumerate(col_vals):
                 # Add text
-                self.ax.text(x + 0.015 + (i)*colwidth, y-0.06-(row*0.025), value, fontsize=8, ha='left')
+                texts.append((col_text_xs[i], row_text_ys[row], value, 8, 'normal', 'left'))
 
                 # Add Divider
-                xmin = x + 0.01 + (i)*colwidth
-                xmax = x + (i+1)*colwidth
-                self.ax.axhline(y=y-0.069-(row*0.025), xmin=xmin, xmax=xmax, color=(0.9,0.9,0.9), linewidth=1) # hline
-        
-        # Divider
-        xmin = x + 0.01 + (col)*colwidth
-        xmax = x + (col+1)*colwidth
-        self.ax.axhline(y=y-0.069-(row*0.025), xmin=xmin, xmax=xmax, color=(0.9,0.9,0.9), linewidth=1) # hline      
+                dividers.append((col_div_xs_min[i], col_div_xs_max[i], row_div_ys[row]))
+
+        # Draw all table lines and text
+        self._draw_hlines(lines, color='k')
+        self._draw_hlines(dividers, color=(0.9,0.9,0.9))
+        self._draw_text_batch(texts)
+
+    def _draw_hlines(self, lines: list, color, linewidth: float=1):
+        """ Draw horizontal lines as a single LineCollection instead of one axhline per line
+
+        Parameters:
+            lines: list of (xmin, xmax, y) tuples, x in axes and y in data coordinates (as axhline)
+            color: line color
+            linewidth: line width
+        """
+        from matplotlib.collections import LineCollection
+
+        segments = [[(xmin, y), (xmax, y)] for xmin, xmax, y in lines]
+        collection = LineCollection(segments, colors=color, linewidths=linewidth,
+                                    transform=self.ax.get_yaxis_transform())
+        self.ax.add_collection(collection, autolim=False)
+
+    def _draw_text_batch(self, entries: list):
+        """ Draw text entries as a single TextBatch artist instead of one Text artist each
+
+        Parameters:
+            entries: list of (x, y, text, fontsize, weight, ha) tuples in data coordinates
+        """
+        from .textbatch import TextBatch
+
+        self.ax.add_artist(TextBatch(entries, transform=self.ax.transData))
 
     def set_footer(self, data, ypos:float = None):
         """
@@ -209,57 +344,105 @@ class RHReport:
                 height: float [0-1]
         """
 
+        from matplotlib.image import BboxImage
+        from matplotlib.transforms import Bbox, TransformedBbox
+
         # Set y-position of footer
         ypos = self.margin[2] if ypos is None else ypos
         
-        for pos in ['left', 'center', 'right']:
-            if not pos in data:
+        # x-position and alignment offset (fraction of image width) for each footer position
+        footer_pos = {
+            'left': (self.margin[3], 0),
+            'center': (0.5, 0.5),
+            'right': (1-self.margin[1], 1),
+        }
+
+        for pos, (xpos, align) in footer_pos.items():
+            cfg = data.get(pos)
+            if cfg is None:
                 continue
             # Text
-            if data[pos]['type'] == 'text':
-                textcolor = data[pos]['color'] if 'color' in data[pos] else mpl.rcParams['text.color']
-                fontsize = data[pos]['fontsize'] if 'fontsize' in data[pos] else 'x-small' # mpl.rcParams['font.size']
-                linespacing = data[pos]['linespacing'] if 'linespacing' in data[pos] else 1.5
-
-                # Different xpos depending on position
-                if pos == 'left':
-                    xpos = self.margin[3]
-                elif pos == 'center':
-                    xpos = 0.5
-                elif pos == 'right':
-                    xpos = 1-self.margin[1]
-                self.ax.text(xpos, ypos, data[pos]['content'], fontsize=fontsize, color=textcolor, linespacing=linespacing, ha=pos)
+            if cfg['type'] == 'text':
+                textcolor = cfg.get('color', self._plt.rcParams['text.color'])
+                fontsize = cfg.get('fontsize', 'x-small') # mpl.rcParams['font.size']
+                linespacing = cfg.get('linespacing', 1.5)
+
+                self.ax.text(xpos, ypos, cfg['content'], fontsize=fontsize, color=textcolor,
+                             linespacing=linespacing, ha=pos)
             # Image    
-            elif data[pos]['type'] == 'img':
-                pngfile = data[pos]['src'] if 'src' in data[pos] else print('Error: src not found')
-                im = plt.imread(pngfile)
+            elif cfg['type'] == 'img':
+                pngfile = cfg.get('src')
+                if pngfile is None:
+                    print('Error: src not found')
+                im = _imread(pngfile)
 
                 # Height is accoding to the RegionH design manual set to 1/15 of page height
-                height = data[pos]['height'] if 'height' in data[pos] else (1-self.margin[0]-ypos)/15
+                height = cfg.get('height', (1-self.margin[0]-ypos)/15)
                 width = im.shape[1] * height/im.shape[0]
 
-                # Different xpos depending on position
-                if pos == 'left':
-                    xpos = self.margin[3]
-                elif pos == 'center':
-                    xpos = 0.5-width/2
-                elif pos == 'right':
-                    xpos = 1-self.margin[1]-width
+                # Align image to its position
+                xpos -= align*width
                     
-                # Create axes with position of logo
-                ax = self.fig.add_axes([xpos, ypos-0.008, width, height])
-
-                # Display the image in the axes
-                ax.imshow(im, interpolation='none')
-                ax.axis('off')  # Remove axis of the image
+                # Keep aspect ratio on the non-square page, image is centered vertically
+                fig_w, fig_h = self.fig.get_size_inches()
+                imheight = width * fig_w/fig_h * im.shape[0]/im.shape[1]
+                ybottom = ypos - 0.008 + (height-imheight)/2
+
+                # Draw the image directly on the figure without creating an axes
+                bbox = Bbox.from_bounds(xpos, ybottom, width, imheight)
+                bbox = TransformedBbox(bbox, self.fig.transFigure)
+                image = BboxImage(bbox, interpolation='none', origin='upper')
+                image.set_data(im)
+                self.fig.add_artist(image)
 
     def save(self, filename: Path)->Path:
         """ Save report to PDF
+
+        The figure is pre-sized to A4, so it is saved as-is without a tight bounding box pass.
+        """
+        return self.batch_save([self], filename)
+
+    def save_page(self, pdf):
+        """ Add report as a page to a PDF opened with RHReport.open_pdf
+
+        The figure is kept open, so the report can be reset and reused for the next page.
+
+        Parameters:
+            pdf: PdfPages from RHReport.open_pdf
+        """
+        pdf.savefig(self.fig, bbox_inches=None, pad_inches=0)
+
+    @classmethod
+    @contextmanager
+    def open_pdf(cls, filename: Path):
+        """ Open a multi-page PDF, pages are added with save_page
+
+        The PDF rcParams are applied until the PDF is closed.
+
+        Parameters:
+            filename: PDF filename
+        """
+        import matplotlib as mpl
+        from matplotlib.backends.backend_pdf import PdfPages
+
+        with mpl.rc_context(_PDF_RCPARAMS), PdfPages(filename) as pdf:
+            yield pdf
+
+    @classmethod
+    def batch_save(cls, reports: list, filename: Path)->Path:
+        """ Save multiple reports as pages of a single PDF
+
+        Parameters:
+            reports: list of separate RHReport instances, one page each
+                - a reused (reset) instance is saved page by page with open_pdf/save_page
+            filename: PDF filename
         """
-        # Save figure as PDF
-        plt.savefig(filename, format='pdf')
+        with cls.open_pdf(filename) as pdf:
+            for report in reports:
+                # Save figure as PDF page
+                report.save_page(pdf)
 
-        # Cleanup
-        plt.close(self.fig)
+                # Cleanup
+                report._plt.close(report.fig)
 
         return filename
\ No newline at end of file
@@ -0,0 +1,103 @@
+import matplotlib as mpl
+import matplotlib.colors as mcolors
+from matplotlib.artist import Artist, allow_rasterization
+from matplotlib.font_manager import FontProperties
+
+class TextBatch(Artist):
+    """ Draw many strings as a single artist
+
+    Each entry is drawn with renderer.draw_text, so it stays real (selectable) text in
+    the PDF, but without the overhead of a Text artist per string. Entries are anchored
+    like Text with va='baseline' and are never parsed as mathtext.
+    """
+
+    zorder = 3
+
+    # Line metrics shared by all batches, so labels repeated across rows and reports are
+    # measured once. Keyed on renderer type and dpi, text and the resolved font properties.
+    _metrics_cache = {}
+    _metrics_cache_size = 4096
+
+    def __init__(self, entries: list, transform, color=None, linespacing: float=1.2):
+        """
+        Parameters:
+            entries: list of (x, y, text, fontsize, weight, ha) tuples
+            transform: transform of the (x, y) positions
+            color: text color, default rcParams['text.color']
+            linespacing: line spacing in multiples of the font size
+        """
+        super().__init__()
+        self.set_transform(transform)
+        self.set_clip_on(False)
+        self.color = mpl.rcParams['text.color'] if color is None else color
+        self.linespacing = linespacing
+
+        # Resolve font properties once per font spec
+        props = {}
+        self.entries = []
+        for x, y, txt, fontsize, weight, ha in entries:
+            if (fontsize, weight) not in props:
+                props[(fontsize, weight)] = FontProperties(size=fontsize, weight=weight)
+            self.entries.append((x, y, str(txt), props[(fontsize, weight)], ha))
+
+    def _metrics(self, renderer, txt: str, prop: FontProperties):
+        """ Width, height and descent of a single line of text in display units
+        """
+        key = (type(renderer), renderer.points_to_pixels(72), txt, prop)
+        metrics = self._metrics_cache.get(key)
+        if metrics is None:
+            if len(self._metrics_cache) >= self._metrics_cache_size:
+                self._metrics_cache.clear()
+            metrics = renderer.get_text_width_height_descent(txt, prop, ismath=False)
+            self._metrics_cache[key] = metrics
+
+        return metrics
+
+    def _layout(self, renderer, txt: str, prop: FontProperties, ha: str):
+        """ Offset of each line from the anchor, which is the baseline of the last line
+
+        Returns:
+            list of (line, dx, dy) tuples in display units
+        """
+        lines = txt.split('\n')
+        _, lp_h, _ = self._metrics(renderer, 'lp', prop)
+        line_height = self.linespacing * lp_h
+        align = {'left': 0, 'center': 0.5, 'right': 1}[ha]
+
+        layout = []
+        for i, line in enumerate(lines):
+            if not line:
+                continue
+            w, _, _ = self._metrics(renderer, line, prop)
+            layout.append((line, -align*w, (len(lines)-1-i)*line_height))
+
+        return layout
+
+    @allow_rasterization
+    def draw(self, renderer):
+        if not self.get_visible() or not self.entries:
+            return
+
+        renderer.open_group('textbatch', self.get_gid())
+
+        gc = renderer.new_gc()
+        gc.set_foreground(mcolors.to_rgba(self.color), isRGBA=True)
+        gc.set_alpha(self.get_alpha())
+        gc.set_url(self.get_url())
+        gc.set_antialiased(mpl.rcParams['text.antialiased'])
+        self._set_gc_clip(gc)
+
+        trans = self.get_transform()
+        _, canvash = renderer.get_canvas_width_height()
+
+        for x, y, txt, prop, ha in self.entries:
+            posx, posy = trans.transform((x, y))
+            for line, dx, dy in self._layout(renderer, txt, prop, ha):
+                linex, liney = posx + dx, posy + dy
+                if renderer.flipy():
+                    liney = canvash - liney
+                renderer.draw_text(gc, linex, liney, line, prop, 0, ismath=False)
+
+        gc.restore()
+        renderer.close_group('textbatch')
+        self.stale = False
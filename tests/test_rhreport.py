@@ -0,0 +1,392 @@
+import re
+import os
+import subprocess
+import sys
+from io import BytesIO
+from pathlib import Path
+
+import matplotlib as mpl
+import numpy as np
+import pytest
+from matplotlib.cbook import is_math_text
+from matplotlib.image import BboxImage, imsave
+
+from rhreport import RHReport
+from rhreport.rhreport import _imread
+from rhreport.textbatch import TextBatch
+
+
+def count_pages(filename):
+    return len(re.findall(rb'/Type\s*/Page(?!s)', Path(filename).read_bytes()))
+
+
+def pdf_text_ops(filename):
+    return len(re.findall(rb'\bT[jJ]\b', Path(filename).read_bytes()))
+
+
+@pytest.fixture
+def report():
+    report = RHReport()
+    yield report
+    report._plt.close(report.fig)
+
+
+@pytest.fixture
+def pngfile(tmp_path):
+    filename = tmp_path / 'logo.png'
+    im = np.zeros((10, 30, 4))
+    im[..., 0] = 1
+    im[..., 3] = 1
+    imsave(filename, im)
+    return filename
+
+
+def test_create_table_text_batch(report, tmp_path):
+    data = {'A': {'r1': 1, 'r2': 2}, 'B': {'r1': 3, 'r2': 'l1\nl2'}}
+    report.create_table([0.1, 0.7, 0.8, 0], data)
+
+    # All table text in one artist instead of one Text per string
+    batches = [a for a in report.ax.get_children() if isinstance(a, TextBatch)]
+    assert len(batches) == 1
+    assert not report.ax.texts
+    texts = [txt for _, _, txt, _, _ in batches[0].entries]
+    assert texts == ['A', 'B', 'r1', 'r2', '1', '2', '3', 'l1\nl2']
+
+    # Text is kept as real text in the PDF
+    filename = tmp_path / 'report.pdf'
+    with mpl.rc_context({'pdf.compression': 0}):
+        report.fig.savefig(filename, format='pdf')
+    assert pdf_text_ops(filename) >= len(texts) + 1
+
+
+def test_text_batch_layout(report):
+    batch = TextBatch([(0.5, 0.5, 'l1\nl2', 8, 'normal', 'right')], report.ax.transData)
+    renderer = report.fig.canvas.get_renderer()
+    _, _, _, prop, _ = batch.entries[0]
+
+    # Multi-line text is drawn line by line, anchored at the baseline of the last line
+    (line1, dx1, dy1), (line2, dx2, dy2) = batch._layout(renderer, 'l1\nl2', prop, 'right')
+    assert (line1, line2) == ('l1', 'l2')
+    assert dy1 > dy2 == 0
+
+    # Right aligned lines end at the anchor
+    w, _, _ = renderer.get_text_width_height_descent('l1', prop, ismath=False)
+    assert dx1 == pytest.approx(-w)
+
+
+def test_create_table_lines(report):
+    data = {'A': {'r1': 1, 'r2': 2}, 'B': {'r1': 3, 'r2': 4}}
+    report.create_table([0.1, 0.7, 0.6, 0], data)
+
+    # Header rules and row dividers are drawn as one LineCollection each
+    lines, dividers = report.ax.collections
+    assert not report.ax.lines
+    assert [seg.tolist() for seg in lines.get_segments()] == [
+        [[0.1, pytest.approx(0.69)], [0.7, pytest.approx(0.69)]],
+        [[0.1, pytest.approx(0.66)], [0.7, pytest.approx(0.66)]],
+    ]
+
+    # Row header divider and a divider per cell in each row
+    ys = sorted({round(seg[0][1], 6) for seg in dividers.get_segments()})
+    assert ys == [pytest.approx(0.606), pytest.approx(0.631)]
+    assert all(seg[0][1] == seg[1][1] for seg in dividers.get_segments())
+
+
+@pytest.mark.parametrize('rowheader', [True, False])
+def test_create_table_dividers(report, rowheader):
+    data = {'A': {'r1': 1, 'r2': 2}, 'B': {'r1': 3, 'r2': 4}}
+    report.create_table([0.1, 0.7, 0.6, 0], data, rowheader=rowheader)
+
+    # One divider per cell and per row header, none drawn twice
+    _, dividers = report.ax.collections
+    segments = [tuple(seg.ravel().round(6)) for seg in dividers.get_segments()]
+    assert len(segments) == 4 + 2*rowheader
+    assert len(set(segments)) == len(segments)
+
+
+@pytest.mark.parametrize('data', [{}, {'A': {}}])
+def test_create_table_empty(report, data):
+    report.create_table([0.1, 0.7, 0.6, 0], data)
+
+    # Only the header rules are drawn
+    lines, dividers = report.ax.collections
+    assert len(lines.get_segments()) == 2
+    assert not len(dividers.get_segments())
+
+
+def test_set_demographics_lines(report):
+    report.set_demographics([0.1, 0.9, 0.8, 0.04], {'Name': 'John Doe'})
+
+    lines, = report.ax.collections
+    segments = [seg.tolist() for seg in lines.get_segments()]
+    assert segments == [[[0.1, 0.9], [pytest.approx(0.9), 0.9]],
+                        [[0.1, pytest.approx(0.86)], [pytest.approx(0.9), pytest.approx(0.86)]]]
+
+
+def test_set_title_subtitle_position(report):
+    report.set_title(0.9, title='AIMS', subtitle='Subtitle')
+    title, subtitle = report.ax.texts
+
+    # Subtitle starts one space after the title
+    renderer = report.fig.canvas.get_renderer()
+    inv = report.ax.transData.inverted()
+    width = title.get_window_extent(renderer).transformed(inv).width
+    space = subtitle.get_position()[0] - title.get_position()[0] - width
+    assert subtitle.get_position()[1] == title.get_position()[1] == 0.9
+    assert 0 < space < 0.03
+
+
+def test_imread_cache(pngfile):
+    im = _imread(str(pngfile))
+    assert _imread(pngfile) is im
+
+    # Opaque image is decoded to uint8 RGB
+    assert im.dtype == np.uint8
+    assert im.shape == (10, 30, 3)
+    assert (im[..., 0] == 255).all()
+
+    # Cached image is read-only
+    assert not im.flags.writeable
+    with pytest.raises(ValueError):
+        im[0, 0, 0] = 0
+
+
+def test_imread_file_object(pngfile):
+    im = _imread(BytesIO(pngfile.read_bytes()))
+    assert im is not _imread(BytesIO(pngfile.read_bytes()))
+    assert im.dtype == np.uint8
+    assert im.shape == (10, 30, 3)
+
+
+def test_imread_transparent(tmp_path):
+    filename = tmp_path / 'transparent.png'
+    imsave(filename, np.full((4, 4, 4), 0.5))
+
+    # Alpha channel is kept when the image is not opaque
+    im = _imread(filename)
+    assert im.dtype == np.uint8
+    assert im.shape == (4, 4, 4)
+
+
+def test_save(report, tmp_path):
+    filename = tmp_path / 'report.pdf'
+    assert report.save(filename) == filename
+    assert count_pages(filename) == 1
+
+
+def test_batch_save(tmp_path):
+    reports = [RHReport() for _ in range(3)]
+    for i, report in enumerate(reports):
+        report.set_title(0.9, f'Report {i}')
+
+    filename = tmp_path / 'reports.pdf'
+    assert RHReport.batch_save(reports, filename) == filename
+    assert count_pages(filename) == 3
+
+
+def test_batch_save_rcparams(tmp_path):
+    before = {k: mpl.rcParams[k] for k in ['pdf.fonttype', 'pdf.compression']}
+    report = RHReport()
+    report.set_title(0.9, 'Report')
+    RHReport.batch_save([report], tmp_path / 'report.pdf')
+
+    # TrueType fonts are embedded, but the global rcParams are left untouched
+    assert b'/FontFile2' in (tmp_path / 'report.pdf').read_bytes()
+    assert {k: mpl.rcParams[k] for k in before} == before
+
+
+def test_set_demographics_fields(report):
+    fields = {'Name': 'John Doe', 'ID': 12, 'Sex': 'M'}
+    report.set_demographics([0.1, 0.9, 0.8, 0.04], fields)
+
+    batch, = [a for a in report.ax.get_children() if isinstance(a, TextBatch)]
+    entries = [(x, y, txt, ha) for x, y, txt, _, ha in batch.entries]
+
+    # Fields are spaced by string length, the last field is aligned to the right
+    colwidth = 0.78/13
+    assert entries == [
+        (pytest.approx(0.11), pytest.approx(0.885), 'Name', 'left'),
+        (pytest.approx(0.11), pytest.approx(0.87), 'John Doe', 'left'),
+        (pytest.approx(0.11 + 8*colwidth), pytest.approx(0.885), 'ID', 'left'),
+        (pytest.approx(0.11 + 8*colwidth), pytest.approx(0.87), '12', 'left'),
+        (pytest.approx(0.89), pytest.approx(0.885), 'Sex', 'right'),
+        (pytest.approx(0.89), pytest.approx(0.87), 'M', 'right'),
+    ]
+
+
+@pytest.mark.parametrize('fields', [{'': ''}, {'': '', 'ID': ''}])
+def test_set_demographics_empty_strings(report, fields):
+    report.set_demographics([0.1, 0.9, 0.8, 0.04], fields)
+
+    batch, = [a for a in report.ax.get_children() if isinstance(a, TextBatch)]
+    assert len(batch.entries) == 2*len(fields)
+
+
+def test_add_text_kwargs(report):
+    txt = report.add_text(0.5, 0.5, 'text', color='r', ha='center')
+    assert txt.get_text() == 'text'
+    assert txt.get_color() == 'r'
+    assert txt.get_ha() == 'center'
+    assert txt.get_fontsize() == 10
+
+    txt = report.add_text(0.5, 0.5, 'text', fontsize=6)
+    assert txt.get_fontsize() == 6
+
+
+def test_create_axes(report):
+    axs = report.create_axes([0.1, 0.1, 0.8, 0.2], ncols=3, bare=True)
+    assert len(axs) == 3
+    for i, ax in enumerate(axs):
+        assert ax in report.fig.axes
+        assert ax.get_position().bounds == pytest.approx((0.1 + i*0.8/3, 0.1, 0.8/3, 0.2))
+        assert len(ax.get_xticks()) == 0
+        assert len(ax.get_yticks()) == 0
+        assert not ax.get_frame_on()
+
+    ax, = report.create_axes([0.1, 0.5, 0.8, 0.2])
+    assert len(ax.get_xticks()) > 0
+    assert ax.get_frame_on()
+
+
+def test_set_title_cached_inverse(report):
+    report.set_title(0.9, title='AIMS', subtitle='First')
+    report.set_title(0.8, title='AIMS', subtitle='Second')
+    _, first, _, second = report.ax.texts
+
+    # Backdrop axes covers the page, so the cached inverse maps pixels to figure fractions
+    width, height = report.fig.get_size_inches() * report.fig.dpi
+    assert report._data_inv.transform((width, height)) == pytest.approx((1, 1))
+    assert first.get_position()[0] == second.get_position()[0]
+
+
+def footer_images(report):
+    return [a for a in report.fig.get_children() if isinstance(a, BboxImage)]
+
+
+def test_set_footer_image(report, pngfile):
+    report.set_footer({'left': {'type': 'img', 'src': pngfile}})
+
+    # Image is drawn on the figure without an extra axes
+    image, = footer_images(report)
+    assert report.fig.axes == [report.ax]
+
+    # Image keeps its aspect ratio on the page and starts at the left margin
+    fig_w, fig_h = report.fig.get_size_inches() * report.fig.dpi
+    x0, y0, width, height = image.get_window_extent().bounds
+    assert width/height == pytest.approx(3)
+    assert x0 == pytest.approx(report.margin[3] * fig_w)
+    assert y0 + height/2 == pytest.approx((0.05 - 0.008 + 0.875/15/2) * fig_h)
+
+
+def test_set_footer_image_data(report, pngfile):
+    report.set_footer({'left': {'type': 'img', 'src': pngfile}})
+
+    image, = footer_images(report)
+    assert image.get_array().dtype == np.uint8
+    assert image.get_array().shape == (10, 30, 3)
+
+
+def test_import_does_not_load_matplotlib():
+    code = 'import sys, rhreport; assert "matplotlib" not in sys.modules'
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+
+def test_text_batch_metrics_cache(report):
+    renderer = report.fig.canvas.get_renderer()
+    TextBatch._metrics_cache.clear()
+
+    batch = TextBatch([(0.1, 0.1, 'Name', 8, 'bold', 'left')], report.ax.transData)
+    _, _, _, prop, _ = batch.entries[0]
+    metrics = batch._metrics(renderer, 'Name', prop)
+    assert batch._metrics(renderer, 'Name', prop) is metrics
+
+    # Font rcParams are part of the key, so changing fonts does not return stale metrics
+    with mpl.rc_context({'font.family': 'monospace'}):
+        other = TextBatch([(0.1, 0.1, 'Name', 8, 'bold', 'left')], report.ax.transData)
+    _, _, _, other_prop, _ = other.entries[0]
+    assert other._metrics(renderer, 'Name', other_prop) != metrics
+    assert len(TextBatch._metrics_cache) == 2
+
+
+def test_escape_math(report):
+    report.set_title(0.9, 'Cost $5 and $6', subtitle='$x$')
+    for txt in report.ax.texts:
+        assert not is_math_text(txt.get_text())
+
+    # Batched text is drawn as is, without mathtext parsing
+    report.create_table([0.1, 0.7, 0.8, 0], {'$A$': {'$r$': '$x^2$'}})
+    batch, = [a for a in report.ax.get_children() if isinstance(a, TextBatch)]
+    assert [txt for _, _, txt, _, _ in batch.entries] == ['$A$', '$r$', '$x^2$']
+    report.fig.canvas.draw()
+
+
+def test_reset(report):
+    report.set_title(0.9, 'Title')
+    report.create_table([0.1, 0.7, 0.8, 0], {'A': {'r1': 1}})
+    report.create_axes([0.1, 0.1, 0.8, 0.2])
+    report.reset()
+
+    assert report.fig.axes == [report.ax]
+    assert not [a for a in report.ax.get_children() if isinstance(a, TextBatch)]
+    assert not report.ax.texts
+    assert not report.ax.collections
+    assert not report.ax.axison
+    assert report.ax.get_position().bounds == (0, 0, 1, 1)
+
+
+def test_reset_pages(report, tmp_path):
+    filename = tmp_path / 'reports.pdf'
+    with RHReport.open_pdf(filename) as pdf:
+        for title in ['First page', 'Second page']:
+            report.reset()
+            report.set_title(0.9, title)
+            report.save_page(pdf)
+
+    assert count_pages(filename) == 2
+    assert report._plt.fignum_exists(report.fig.number)
+
+
+def test_set_footer_positions(report, pngfile):
+    footer = {pos: {'type': 'img', 'src': pngfile} for pos in ['left', 'center', 'right']}
+    report.set_footer(footer)
+    report.set_footer({
+        'left': {'type': 'text', 'content': 'left'},
+        'center': {'type': 'text', 'content': 'center', 'color': 'r', 'fontsize': 6},
+        'right': {'type': 'text', 'content': 'right', 'linespacing': 2},
+    }, ypos=0.5)
+
+    # Images are aligned to the margins and the page center
+    fig_w = report.fig.get_size_inches()[0] * report.fig.dpi
+    bounds = [image.get_window_extent().bounds for image in footer_images(report)]
+    x0s = [x0/fig_w for x0, _, _, _ in bounds]
+    x1s = [(x0 + w)/fig_w for x0, _, w, _ in bounds]
+    assert x0s[0] == pytest.approx(report.margin[3])
+    assert (x0s[1] + x1s[1])/2 == pytest.approx(0.5)
+    assert x1s[2] == pytest.approx(1 - report.margin[1])
+
+    # Text is aligned the same way, with defaults for missing settings
+    left, center, right = report.ax.texts
+    assert [txt.get_position() for txt in (left, center, right)] == [
+        (report.margin[3], 0.5), (0.5, 0.5), (1 - report.margin[1], 0.5)]
+    assert [txt.get_ha() for txt in (left, center, right)] == ['left', 'center', 'right']
+    assert left.get_linespacing() == 1.5 and right.get_linespacing() == 2
+    assert center.get_color() == 'r' and center.get_fontsize() == 6
+
+
+@pytest.mark.parametrize('env, backend', [({}, 'agg'), ({'MPLBACKEND': 'svg'}, 'svg')])
+def test_pyplot_backend(env, backend):
+    code = ('import matplotlib as mpl; from rhreport import RHReport; RHReport(); '
+            'print(mpl.get_backend().lower())')
+    env = {**{k: v for k, v in os.environ.items() if k != 'MPLBACKEND'}, **env}
+    out = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                         capture_output=True, text=True).stdout
+    assert out.strip() == backend
+
+
+def test_pyplot_keeps_chosen_backend():
+    code = ('import matplotlib as mpl; mpl.use("pdf"); from rhreport import RHReport; '
+            'RHReport(); print(mpl.get_backend().lower())')
+    env = {k: v for k, v in os.environ.items() if k != 'MPLBACKEND'}
+    out = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                         capture_output=True, text=True).stdout
+    assert out.strip() == 'pdf'